@@ -1,54 +1,92 @@
 from __future__ import annotations
 
-import os
-import tempfile
+import asyncio
+import logging
 
 import cv2
 import numpy as np
 from fastapi import APIRouter, File, HTTPException, UploadFile
 
 from models import (
+    ConfigResponse,
     RecognizeBatchResponse,
     RecognizeItem,
     RecognizePerImage,
-    RecognizeResponse,
 )
 from services import RecognitionService
+import utils
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
-# @router.post("/recognize", response_model=RecognizeResponse)
-# async def recognize(file: UploadFile = File(...)) -> RecognizeResponse:
-#     if not file.filename:
-#         raise HTTPException(status_code=400, detail="File is required")
-
-#     # Save the uploaded image to a temporary file that DeepFace can read
-#     try:
-#         suffix = os.path.splitext(file.filename)[1] or ".jpg"
-#         fd, tmp_path = tempfile.mkstemp(suffix=suffix, prefix="upload_")
-#         os.close(fd)
-#         data = await file.read()
-#         np_arr = np.frombuffer(data, np.uint8)
-#         img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-#         if img is None:
-#             raise ValueError("Invalid image file")
-#         cv2.imwrite(tmp_path, img)
-#     except Exception as e:  # noqa: BLE001
-#         raise HTTPException(status_code=400, detail=f"Failed to process image: {e}")
-
-#     service = RecognitionService.instance()
-#     try:
-#         results_raw = service.recognize_image_path(tmp_path)
-#     finally:
-#         try:
-#             os.remove(tmp_path)
-#         except OSError:
-#             pass
-
-#     items = [RecognizeItem(**r) for r in results_raw]
-#     return RecognizeResponse(num_faces=len(items), results=items)
+# 1 MiB read granularity; keeps the spooled upload moving without huge chunks.
+_READ_CHUNK = 1 << 20
+
+
+async def _read_upload(f: UploadFile) -> bytes | bytearray:
+    size = getattr(f, "size", None)
+    if not size:
+        return await f.read()
+    # Preallocate from Content-Length and fill in place: one allocation for
+    # the whole body, no bytes concatenation, and np.frombuffer later wraps
+    # the bytearray without copying.
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        chunk = await f.read(min(_READ_CHUNK, size - pos))
+        if not chunk:
+            break
+        view[pos : pos + len(chunk)] = chunk
+        pos += len(chunk)
+    view.release()
+    if pos != size:
+        # Body shorter than advertised; trim (rare, so the copy is acceptable).
+        return buf[:pos]
+    return buf
+
+
+def _process_one(
+    service: RecognitionService, data: bytes | bytearray, filename: str
+) -> RecognizePerImage:
+    # Runs in a worker thread: keep all blocking cv2/DeepFace work off the event loop.
+    if not filename:
+        return RecognizePerImage(filename="", num_faces=0, results=[])
+    try:
+        if not data:
+            return RecognizePerImage(filename=filename, num_faces=0, results=[])
+
+        # Convert to numpy array and decode
+        np_arr = np.frombuffer(data, np.uint8)
+        if len(np_arr) == 0:
+            return RecognizePerImage(filename=filename, num_faces=0, results=[])
+
+        # Decode oversized photos at half resolution: halves the JPEG IDCT and
+        # all downstream detection work, and face recall doesn't need 4000px.
+        flags = (
+            cv2.IMREAD_REDUCED_COLOR_2
+            if len(data) > utils.LARGE_UPLOAD_BYTES
+            else cv2.IMREAD_COLOR
+        )
+        img = cv2.imdecode(np_arr, flags)
+        if img is None:
+            return RecognizePerImage(filename=filename, num_faces=0, results=[])
+        # Make the layout contiguous once here rather than letting DeepFace
+        # copy lazily downstream.
+        if not img.flags["C_CONTIGUOUS"]:
+            img = np.ascontiguousarray(img)
+
+        # Process with recognition service straight from memory
+        results_raw = service.recognize_image_array(img)
+        items = [RecognizeItem(**r) for r in results_raw]
+        return RecognizePerImage(filename=filename, num_faces=len(items), results=items)
+
+    except Exception:
+        logger.exception("Error processing %s", filename)
+        return RecognizePerImage(filename=filename, num_faces=0, results=[])
 
 
 @router.post("/recognize-batch", response_model=RecognizeBatchResponse)
@@ -57,54 +95,33 @@ async def recognize_batch(files: list[UploadFile] = File(...)) -> RecognizeBatch
         raise HTTPException(status_code=400, detail="At least one file is required")
 
     service = RecognitionService.instance()
-    outputs: list[RecognizePerImage] = []
-
-    for f in files:
-        if not f.filename:
-            outputs.append(RecognizePerImage(filename="", num_faces=0, results=[]))
-            continue
-        
-        try:
-            # Read file data
-            data = await f.read()
-            if not data or len(data) == 0:
-                outputs.append(RecognizePerImage(filename=f.filename, num_faces=0, results=[]))
-                continue
-            
-            # Convert to numpy array and decode
-            np_arr = np.frombuffer(data, np.uint8)
-            if len(np_arr) == 0:
-                outputs.append(RecognizePerImage(filename=f.filename, num_faces=0, results=[]))
-                continue
-                
-            img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-            if img is None:
-                outputs.append(RecognizePerImage(filename=f.filename, num_faces=0, results=[]))
-                continue
-            
-            # Save to temporary file
-            suffix = os.path.splitext(f.filename)[1] or ".jpg"
-            fd, tmp_path = tempfile.mkstemp(suffix=suffix, prefix="upload_")
-            os.close(fd)
-            cv2.imwrite(tmp_path, img)
-            
-            # Process with recognition service
-            results_raw = service.recognize_image_path(tmp_path)
-            items = [RecognizeItem(**r) for r in results_raw]
-            outputs.append(RecognizePerImage(filename=f.filename, num_faces=len(items), results=items))
-            
-        except Exception as e:
-            print(f"Error processing {f.filename}: {e}")
-            outputs.append(RecognizePerImage(filename=f.filename, num_faces=0, results=[]))
-        finally:
-            # Clean up temporary file
-            try:
-                if 'tmp_path' in locals():
-                    os.remove(tmp_path)
-            except OSError:
-                pass
-    print(f"Outputs: {outputs}")
-    return RecognizeBatchResponse(items=outputs)
+
+    # Read all request bodies concurrently, then fan the blocking per-file
+    # work out to the default thread pool. gather preserves submission order.
+    datas = await asyncio.gather(*[_read_upload(f) for f in files])
+    outputs = await asyncio.gather(
+        *[
+            asyncio.to_thread(_process_one, service, data, f.filename or "")
+            for f, data in zip(files, datas)
+        ]
+    )
+    return RecognizeBatchResponse(items=list(outputs))
+
+
+@router.get("/config", response_model=ConfigResponse)
+async def get_config() -> ConfigResponse:
+    return ConfigResponse(detector=utils.DETECTOR)
+
+
+@router.post("/config", response_model=ConfigResponse)
+async def set_config(detector: str) -> ConfigResponse:
+    service = RecognitionService.instance()
+    try:
+        # Warms the new backend, so keep it off the event loop thread.
+        current = await asyncio.to_thread(service.set_detector, detector)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ConfigResponse(detector=current)
 
 
 
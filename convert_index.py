@@ -0,0 +1,68 @@
+"""One-time migrations of the customer index to faster layouts.
+
+Two targets are supported:
+
+* ``sq8`` (default) — IndexScalarQuantizer with 8-bit codes. Facenet512
+  embeddings are 512 float32 = 2 KB each; 8-bit quantization cuts storage and
+  scan bandwidth 4x with negligible recall loss on face embeddings.
+* ``hnsw`` — IndexHNSWFlat graph search, log-time instead of a linear scan.
+
+Either way the add/search API is unchanged and faiss.read_index loads any
+index type transparently, so nothing in services.py has to change.
+
+Usage: python convert_index.py [sq8|hnsw]
+"""
+
+import sys
+
+import faiss
+
+import utils
+
+HNSW_NEIGHBORS = 32  # graph degree; faiss's recommended default trade-off
+
+
+def _load_vectors() -> "tuple[faiss.Index, object]":
+    index = utils.load_or_create_index()
+    return index, index.reconstruct_n(0, index.ntotal)
+
+
+def convert_to_sq8() -> faiss.Index:
+    index, vectors = _load_vectors()
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        print(" Index is already scalar-quantized — nothing to do.")
+        return index
+
+    print(f" Migrating {index.ntotal} vectors (d={index.d}) to 8-bit IndexScalarQuantizer...")
+    sq = faiss.IndexScalarQuantizer(
+        index.d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+    )
+    sq.train(vectors)
+    sq.add(vectors)
+    utils.persist_index(sq)
+    print(f" Done. Wrote SQ8 index with {sq.ntotal} vectors to '{utils.FAISS_INDEX_PATH}'.")
+    return sq
+
+
+def convert_to_hnsw() -> faiss.Index:
+    index, vectors = _load_vectors()
+    if isinstance(index, faiss.IndexHNSWFlat):
+        print(" Index is already HNSW — nothing to do.")
+        return index
+
+    print(f" Migrating {index.ntotal} vectors (d={index.d}) to IndexHNSWFlat...")
+    hnsw = faiss.IndexHNSWFlat(index.d, HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT)
+    hnsw.add(vectors)
+    utils.persist_index(hnsw)
+    print(f" Done. Wrote HNSW index with {hnsw.ntotal} vectors to '{utils.FAISS_INDEX_PATH}'.")
+    return hnsw
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else "sq8"
+    if target == "sq8":
+        convert_to_sq8()
+    elif target == "hnsw":
+        convert_to_hnsw()
+    else:
+        sys.exit(f"Unknown target '{target}'. Use 'sq8' or 'hnsw'.")
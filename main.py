@@ -1,3 +1,12 @@
+import os
+
+# Pin BLAS/OpenMP pools to one coherent size before numpy/faiss/tensorflow are
+# imported (the libraries read these at import time). setdefault keeps any
+# value exported in the environment authoritative over these defaults.
+_n_threads = str(max(1, (os.cpu_count() or 2) // 2))
+os.environ.setdefault("OMP_NUM_THREADS", _n_threads)
+os.environ.setdefault("MKL_NUM_THREADS", _n_threads)
+
 import uvicorn
 from fastapi import FastAPI
 
@@ -25,3 +25,7 @@ class RecognizeBatchResponse(BaseModel):
     items: list[RecognizePerImage]
 
 
+class ConfigResponse(BaseModel):
+    detector: str
+
+
@@ -1,75 +1,151 @@
 from __future__ import annotations
 
+import functools
+import logging
 import os
 import threading
-from typing import Optional
 
+import cv2
 import faiss
+import numpy as np
+from deepface import DeepFace
 
 import utils
 
 
-class RecognitionService:
-    _instance: Optional["RecognitionService"] = None
-    _instance_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
 
+class RecognitionService:
     def __init__(self) -> None:
-        self.index: faiss.Index = utils.load_or_create_index()
+        # Match the FAISS OpenMP pool to the BLAS pool pinned in main.py so the
+        # two don't double-book cores during batched searches.
+        faiss.omp_set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+        self.index: faiss.Index = self._maybe_to_gpu(utils.load_or_create_index())
+        # Serializes index search/add/persist against concurrent request threads.
+        self._index_lock = threading.Lock()
+        # Build the embedding model once; newer deepface wraps the Keras model
+        # in a FacialRecognition client, older versions return it directly.
+        built = DeepFace.build_model(utils.MODEL_NAME)
+        self.model = getattr(built, "model", built)
+        self._warmup_detector()
+
+    def _maybe_to_gpu(self, index: faiss.Index) -> faiss.Index:
+        # Opt-in: searches on a GPU-resident index are 10-50x faster on larger
+        # databases. Persistence is unaffected — new embeddings go to the
+        # append-only log, and startup compaction runs on the CPU index before
+        # the move (see utils.load_or_create_index).
+        if os.environ.get("FR_FAISS_GPU") != "1":
+            return index
+        if not hasattr(faiss, "StandardGpuResources"):
+            logger.warning("FR_FAISS_GPU=1 but faiss has no GPU support; staying on CPU.")
+            return index
+        try:
+            self._gpu_resources = faiss.StandardGpuResources()
+            return faiss.index_cpu_to_gpu(self._gpu_resources, 0, index)
+        except Exception as e:
+            # index_cpu_to_gpu only supports flat/IVF layouts; the sq8/hnsw
+            # indexes produced by convert_index.py (and any CUDA init failure)
+            # land here rather than killing service construction.
+            logger.warning("FR_FAISS_GPU=1 but GPU conversion failed (%s); staying on CPU.", e)
+            return index
+
+    def _warmup_detector(self) -> None:
+        # Force deepface to construct and cache the detector now so the first
+        # real request doesn't pay the model-load cold start.
+        DeepFace.extract_faces(
+            img_path=np.zeros((64, 64, 3), dtype=np.uint8),
+            detector_backend=utils.DETECTOR,
+            enforce_detection=False,
+        )
+
+    def set_detector(self, detector: str) -> str:
+        if detector not in utils.SUPPORTED_DETECTORS:
+            raise ValueError(
+                f"Unsupported detector '{detector}'. Choose one of {utils.SUPPORTED_DETECTORS}."
+            )
+        utils.DETECTOR = detector
+        # Warm the new backend immediately so the switch doesn't push a cold
+        # start onto the next request.
+        self._warmup_detector()
+        return utils.DETECTOR
+
+    def embed_batch(self, faces_bgr: list[np.ndarray]) -> np.ndarray:
+        # One batch-N forward pass instead of N batch-1 calls; per-crop
+        # preprocessing is fused in utils.preprocess_face.
+        batch = np.stack([utils.preprocess_face(face) for face in faces_bgr])
+        embs = np.asarray(self.model(batch, training=False)).astype("float32")
+        faiss.normalize_L2(embs)
+        return embs
 
     @classmethod
     def instance(cls) -> "RecognitionService":
-        if cls._instance is None:
-            with cls._instance_lock:
-                if cls._instance is None:
-                    cls._instance = RecognitionService()
-        return cls._instance
+        return _singleton()
 
     def reload_index(self) -> int:
-        self.index = utils.load_or_create_index()
-        return self.index.ntotal
+        with self._index_lock:
+            self.index = self._maybe_to_gpu(utils.load_or_create_index())
+            return self.index.ntotal
 
     def recognize_image_path(self, image_path: str) -> list[dict]:
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError("Could not load image.")
+        return self.recognize_image_array(img)
+
+    def recognize_image_array(self, img_bgr: np.ndarray) -> list[dict]:
         # Detect faces first, then classify/match
-        faces = utils.detect_faces_and_crop(image_path)
+        faces = utils.detect_faces_and_crop(img_bgr)
+        if not faces:
+            return []
+
+        embs = self.embed_batch(faces)
         results: list[dict] = []
-        for face_img_bgr in faces:
-            # Compute embedding via tmp write path (DeepFace needs path)
-            tmp_path = utils.save_numpy_image_temp(face_img_bgr)
-            emb = utils.compute_embedding_from_path(tmp_path)
-            try:
-                if self.index.ntotal == 0:
-                    similarity = 0.0
-                    match_idx = -1
-                else:
-                    D, I = self.index.search(emb, k=1)
-                    similarity = float(D[0][0])
-                    match_idx = int(I[0][0])
+        with self._index_lock:
+            # One batched query instead of a 1xD search per face; the loaded
+            # index is guaranteed non-empty (see load_or_create_index), so no
+            # ntotal check on the hot path.
+            D, I = self.index.search(embs, k=1)
 
+            new_rows: list[int] = []
+            for row in range(len(faces)):
+                similarity = float(D[row][0])
+                match_idx = int(I[row][0])
                 is_match = similarity > utils.THRESHOLD
                 if not is_match:
-                    # add to DB (only FAISS index, no image saving)
-                    self.index.add(emb)
-                    faiss.write_index(self.index, utils.FAISS_INDEX_PATH)
-                    results.append(
-                        {
-                            "is_returning": False,
-                            "similarity": similarity,
-                            "index": match_idx,
-                        }
-                    )
-                else:
-                    results.append(
-                        {
-                            "is_returning": True,
-                            "similarity": similarity,
-                            "index": match_idx,
-                        }
-                    )
-            finally:
-                try:
-                    os.remove(tmp_path)
-                except OSError:
-                    pass
+                    new_rows.append(row)
+                results.append(
+                    {
+                        "is_returning": is_match,
+                        "similarity": similarity,
+                        "index": match_idx,
+                    }
+                )
+
+            if new_rows:
+                # add to DB (only FAISS index, no image saving); the in-memory
+                # index gets the vectors, disk gets an O(new) log append instead
+                # of a full index rewrite — compacted on next startup
+                new_embs = np.vstack([embs[row] for row in new_rows])
+                self.index.add(new_embs)
+                utils.append_embeddings_log(new_embs)
         return results
 
 
+_singleton_lock = threading.Lock()
+_instance: RecognitionService | None = None
+
+
+@functools.cache
+def _singleton() -> RecognitionService:
+    # functools.cache does not lock on a miss, so threads racing the first
+    # call can all enter this body; the lock plus the None check make sure
+    # only one of them constructs the service. Once a call completes, the
+    # cache returns the instance without ever touching the lock again.
+    global _instance
+    with _singleton_lock:
+        if _instance is None:
+            _instance = RecognitionService()
+    return _instance
+
+
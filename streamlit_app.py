@@ -1,6 +1,5 @@
 import io
 import os
-import tempfile
 import threading
 from typing import List, Dict, Any, Optional
 import streamlit as st
@@ -32,6 +31,7 @@ except ImportError as e:
 
 # Import our modules
 try:
+    import utils
     from services import RecognitionService
     from models import RecognizeItem, RecognizePerImage, RecognizeBatchResponse
 except ImportError as e:
@@ -57,32 +57,30 @@ def process_images_directly(files: List[bytes], filenames: List[str]) -> Dict[st
                     outputs.append(RecognizePerImage(filename=filename, num_faces=0, results=[]))
                     continue
                     
-                img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+                # Decode oversized photos at half resolution, matching the
+                # API pipeline: big phone photos only slow down detection.
+                flags = (
+                    cv2.IMREAD_REDUCED_COLOR_2
+                    if len(file_bytes) > utils.LARGE_UPLOAD_BYTES
+                    else cv2.IMREAD_COLOR
+                )
+                img = cv2.imdecode(np_arr, flags)
                 if img is None:
                     outputs.append(RecognizePerImage(filename=filename, num_faces=0, results=[]))
                     continue
-                
-                # Save to temporary file for DeepFace processing
-                suffix = os.path.splitext(filename)[1] or ".jpg"
-                fd, tmp_path = tempfile.mkstemp(suffix=suffix, prefix="upload_")
-                os.close(fd)
-                cv2.imwrite(tmp_path, img)
-                
-                # Process with recognition service
-                results_raw = service.recognize_image_path(tmp_path)
+                # Make the layout contiguous once here rather than letting
+                # DeepFace copy lazily downstream.
+                if not img.flags["C_CONTIGUOUS"]:
+                    img = np.ascontiguousarray(img)
+
+                # Process with recognition service straight from memory
+                results_raw = service.recognize_image_array(img)
                 items = [RecognizeItem(**r) for r in results_raw]
                 outputs.append(RecognizePerImage(filename=filename, num_faces=len(items), results=items))
-                
+
             except Exception as e:
                 st.error(f"Error processing {filename}: {e}")
                 outputs.append(RecognizePerImage(filename=filename, num_faces=0, results=[]))
-            finally:
-                # Clean up temporary file
-                try:
-                    if 'tmp_path' in locals():
-                        os.remove(tmp_path)
-                except OSError:
-                    pass
         
         return {"items": [item.dict() for item in outputs]}
         
@@ -1,5 +1,5 @@
+import logging
 import os
-import tempfile
 from datetime import datetime
 
 import cv2
@@ -8,11 +8,24 @@ import numpy as np
 from deepface import DeepFace
 
 
+logger = logging.getLogger(__name__)
+
+
 # Shared constants
 MODEL_NAME = "Facenet512"
+EMBED_INPUT_SIZE = (160, 160)  # Facenet512 input resolution
 CUSTOMER_DIR = "known_faces"
 FAISS_INDEX_PATH = "customer_index.faiss"
+EMBEDDINGS_LOG_PATH = FAISS_INDEX_PATH + ".log"  # header-less float32 rows
 THRESHOLD = 0.7  # cosine similarity threshold for "same person"
+# Detection backend. yunet is 3-10x faster than retinaface with adequate
+# recall on upright storefront photos; export FR_DETECTOR=retinaface to opt
+# back into the slower high-accuracy detector.
+SUPPORTED_DETECTORS = ("opencv", "ssd", "mtcnn", "retinaface", "mediapipe", "yunet")
+DETECTOR = os.environ.get("FR_DETECTOR", "yunet")
+# Uploads above this byte count (big phone photos) are decoded at half
+# resolution — full resolution adds decode and detection cost but no recall.
+LARGE_UPLOAD_BYTES = 1_500_000
 
 
 
@@ -27,86 +40,133 @@ def load_or_create_index() -> faiss.Index:
         raise FileNotFoundError(
             f"FAISS index not found at '{FAISS_INDEX_PATH}'. Expected an existing vector DB."
         )
-    print(" Loading existing FAISS index...")
+    logger.info("Loading existing FAISS index...")
     index = faiss.read_index(FAISS_INDEX_PATH)
+    _replay_embeddings_log(index)
+    if index.ntotal == 0:
+        # Sentinel row so searches never run against an empty index: its inner
+        # product with any normalized query is 0.0, below THRESHOLD, so it can
+        # never be reported as a returning customer.
+        index.add(np.zeros((1, index.d), dtype="float32"))
     return index
 
 
-def save_numpy_image_temp(image_bgr: np.ndarray) -> str:
-    # Save to a temporary file path for DeepFace.represent which expects a path
-    fd, tmp_path = tempfile.mkstemp(suffix=".jpg", prefix="_tmp_face_")
-    os.close(fd)
-    cv2.imwrite(tmp_path, image_bgr)
-    return tmp_path
-
-
-def compute_embedding_from_path(img_path: str) -> np.ndarray:
-    rep = DeepFace.represent(img_path=img_path, model_name=MODEL_NAME, enforce_detection=False)
-    emb = np.array(rep[0]["embedding"], dtype="float32").reshape(1, -1)
-    faiss.normalize_L2(emb)
-    return emb
+def _replay_embeddings_log(index: faiss.Index) -> None:
+    # Merge the append-only sidecar into the base index, then compact: rewrite
+    # the base once and truncate the log so it stays bounded per process run.
+    if not os.path.exists(EMBEDDINGS_LOG_PATH):
+        return
+    vecs = np.fromfile(EMBEDDINGS_LOG_PATH, dtype="float32")
+    # Ignore a trailing partial row from an interrupted append.
+    n_rows = vecs.size // index.d
+    if n_rows > 0:
+        index.add(vecs[: n_rows * index.d].reshape(n_rows, index.d))
+        persist_index(index)
+    os.remove(EMBEDDINGS_LOG_PATH)
+
+
+def append_embeddings_log(embs: np.ndarray) -> None:
+    # O(new vectors) append instead of reserializing the whole index per request.
+    with open(EMBEDDINGS_LOG_PATH, "ab") as f:
+        f.write(np.ascontiguousarray(embs, dtype="float32").tobytes())
+
+
+def persist_index(index: faiss.Index) -> None:
+    # Write to a sibling tmp file and rename so readers never see a torn index.
+    tmp_path = FAISS_INDEX_PATH + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, FAISS_INDEX_PATH)
+
+
+def preprocess_face(crop_bgr: np.ndarray) -> np.ndarray:
+    # Crop -> model input in one pass: resize first (so the colour conversion
+    # and float math touch 160x160 pixels, not the full crop), then BGR->RGB
+    # and the same [0, 1] scaling DeepFace's default preprocessing applies.
+    # Both the geometry and the scaling constant must match DeepFace exactly:
+    # every vector already stored in the customer index was embedded from an
+    # aspect-preserving, center-padded letterbox at pixels/255, and there are
+    # no source images to re-embed from.
+    target_w, target_h = EMBED_INPUT_SIZE
+    h, w = crop_bgr.shape[:2]
+    factor = min(target_h / h, target_w / w)
+    resized = cv2.resize(crop_bgr, (max(1, int(w * factor)), max(1, int(h * factor))))
+    rh, rw = resized.shape[:2]
+    canvas = np.zeros((target_h, target_w, 3), dtype=crop_bgr.dtype)
+    top = (target_h - rh) // 2
+    left = (target_w - rw) // 2
+    canvas[top : top + rh, left : left + rw] = resized
+    rgb = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB)
+    return rgb.astype(np.float32) * (1.0 / 255.0)
 
 
 def detect_faces_and_crop(
-    img_path: str,
+    img_bgr: np.ndarray,
     edge_margin_ratio: float = 0.005,
     profile_threshold: float = 0.6,
 ) -> list[np.ndarray]:
+    if img_bgr is None:
+        raise ValueError("Could not load image.")
+    # DeepFace accepts the decoded array directly; no second JPEG decode.
     detections = DeepFace.extract_faces(
-        img_path=img_path,
-        detector_backend="retinaface",
+        img_path=img_bgr,
+        detector_backend=DETECTOR,
         enforce_detection=False,
     )
-    img = cv2.imread(img_path)
-    if img is None:
-        raise ValueError("Could not load image.")
+    img = img_bgr
     img_h, img_w = img.shape[:2]
 
-    cropped_faces: list[np.ndarray] = []
-    print(f" Total detections before filtering: {len(detections)}")
-    for i, face in enumerate(detections):
-        region = face.get("facial_area", {})
-        x = int(region.get("x", 0))
-        y = int(region.get("y", 0))
-        fw = int(region.get("w", 0))
-        fh = int(region.get("h", 0))
-
-        if fw <= 0 or fh <= 0:
-            continue
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Total detections before filtering: %d", len(detections))
+    if not detections:
+        return []
+
+    regions = [face.get("facial_area", {}) for face in detections]
+    boxes = np.array(
+        [
+            [int(r.get("x", 0)), int(r.get("y", 0)), int(r.get("w", 0)), int(r.get("h", 0))]
+            for r in regions
+        ],
+        dtype=np.int64,
+    )
+    x, y, fw, fh = boxes.T
+
+    # Degenerate-box and edge filters in one vectorized pass
+    valid = (fw > 0) & (fh > 0)
+    valid &= ~(
+        (x < img_w * edge_margin_ratio)
+        | (y < img_h * edge_margin_ratio)
+        | ((x + fw) > img_w * (1 - edge_margin_ratio))
+        | ((y + fh) > img_h * (1 - edge_margin_ratio))
+    )
 
-        # Edge filter
-        if (
-            x < img_w * edge_margin_ratio
-            or y < img_h * edge_margin_ratio
-            or (x + fw) > img_w * (1 - edge_margin_ratio)
-            or (y + fh) > img_h * (1 - edge_margin_ratio)
-        ):
-            print(f" Face {i} near image edge — skipped.")
-            continue
+    # Profile filter using landmarks (if available). deepface sets landmark
+    # keys to None for the whole-image fallback and for backends that don't
+    # report eyes, so coerce None to (0, 0) — those rows get eye_distance 0
+    # and fall through to the asymmetry_ratio = 1.0 skip path below. The nose
+    # landmark only comes from retinaface; for every other backend the ratio
+    # would degenerate to |mean_eye_x| / eye_span, so only apply the asymmetry
+    # test to rows where the detector actually reported a nose.
+    left_eye = np.array([r.get("left_eye") or (0, 0) for r in regions], dtype="float64")
+    right_eye = np.array([r.get("right_eye") or (0, 0) for r in regions], dtype="float64")
+    nose = np.array([r.get("nose") or (0, 0) for r in regions], dtype="float64")
+    has_nose = np.array([r.get("nose") is not None for r in regions], dtype=bool)
+
+    eye_distance = np.linalg.norm(left_eye - right_eye, axis=1)
+    nose_to_center = np.abs((left_eye[:, 0] + right_eye[:, 0]) / 2.0 - nose[:, 0])
+    asymmetry_ratio = np.where(
+        eye_distance > 0, nose_to_center / np.maximum(eye_distance, 1e-6), 1.0
+    )
+    valid &= ~has_nose | (asymmetry_ratio <= profile_threshold)
 
-        crop = img[y : y + fh, x : x + fw]
+    cropped_faces: list[np.ndarray] = []
+    for i in np.flatnonzero(valid):
+        crop = img[y[i] : y[i] + fh[i], x[i] : x[i] + fw[i]]
         if crop.size == 0:
             continue
-
-        # Profile filter using landmarks (if available)
-        landmarks = face.get("facial_area", {}) 
-        if landmarks:
-            left_eye = np.array(landmarks.get("left_eye", [0, 0]))
-            right_eye = np.array(landmarks.get("right_eye", [0, 0]))
-            nose = np.array(landmarks.get("nose", [0, 0]))
-
-            eye_distance = float(np.linalg.norm(left_eye - right_eye))
-            nose_to_center = abs((float(left_eye[0]) + float(right_eye[0])) / 2.0 - float(nose[0]))
-            asymmetry_ratio = nose_to_center / eye_distance if eye_distance > 0 else 1.0
-            if asymmetry_ratio > profile_threshold:
-                print(
-                    f" Face {i} likely side profile (asymmetry={asymmetry_ratio:.2f}) — skipped."
-                )
-                continue
-
         cropped_faces.append(crop)
 
-    print(f" Total valid faces after filtering: {len(cropped_faces)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Total valid faces after filtering: %d", len(cropped_faces))
     return cropped_faces
 
 